@@ -36,6 +36,8 @@ CRYPTOS = config["binance"]["cryptos"]
 INTERVAL = config["binance"]["interval"]
 LIMIT = config["binance"]["limit"]
 DEFAULT_START_TIME = config["binance"]["default_start_time"]
+RATE_LIMIT = config["binance"].get("rate_limit", {})
+ARCHIVE_BASE_URL = config["binance"].get("archive_base_url")
 
 # Variáveis para execução do dbt no Docker
 DBT_IMAGE = config["dbt"]["image"]
@@ -74,6 +76,8 @@ def crypto_data_pipeline():
             limit=LIMIT,
             default_start_time=DEFAULT_START_TIME,
             base_url=BINANCE_BASE_URL,
+            rate_limit=RATE_LIMIT,
+            archive_base_url=ARCHIVE_BASE_URL,
         )
         for crypto in CRYPTOS
     }
@@ -9,11 +9,19 @@ from utils.fetch_klines_utils import (
     upload_file_to_gcs,
     delete_parquet_from_gcs,
 )
+from utils.backfill_klines_utils import backfill_klines_from_archives
 
 
 @task()
 def fetch_and_save_klines(
-    symbol, bucket_name, interval, limit, default_start_time, base_url
+    symbol,
+    bucket_name,
+    interval,
+    limit,
+    default_start_time,
+    base_url,
+    rate_limit=None,
+    archive_base_url=None,
 ):
     # Obtém o timestamp atual em milissegundos
     present_time = int(datetime.now(timezone.utc).timestamp() * 1000)
@@ -25,10 +33,16 @@ def fetch_and_save_klines(
         f"{symbol}: Iniciando extração de {start_time} ({datetime.utcfromtimestamp(start_time / 1000)})"
     )
 
+    # Carrega os meses já fechados a partir dos arquivos mensais da Binance, se configurado
+    if archive_base_url:
+        start_time = backfill_klines_from_archives(
+            symbol, bucket_name, interval, limit, start_time, archive_base_url
+        )
+
     # Continua a extração enquanto o start_time for menor que o tempo atual
     while start_time < present_time:
         url = f"{base_url}?symbol={symbol}&interval={interval}&limit={limit}&startTime={start_time}"
-        data = fetch_data(url)
+        data = fetch_data(url, rate_limit=rate_limit)
 
         # Para a execução caso não haja mais dados a serem extraídos
         if not data:
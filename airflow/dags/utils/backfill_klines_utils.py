@@ -0,0 +1,285 @@
+from google.cloud import storage
+import requests
+import hashlib
+import tempfile
+import zipfile
+import io
+import os
+import datetime
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from utils.fetch_klines_utils import generate_gcs_path
+from utils.binance_rate_limit_utils import get_backoff_delay
+
+# Colunas dos arquivos CSV mensais da Binance (mesma ordem da API de klines)
+ARCHIVE_COLUMNS = [
+    "open_time",
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "volume",
+    "close_time",
+    "quote_asset_volume",
+    "number_of_trades",
+    "taker_buy_base_asset_volume",
+    "taker_buy_quote_asset_volume",
+    "_unused",
+]
+
+# Tipos das colunas, equivalentes aos gerados pela extração via API
+ARCHIVE_DTYPES = {
+    "open_time": "int64",
+    "open_price": "float64",
+    "high_price": "float64",
+    "low_price": "float64",
+    "close_price": "float64",
+    "volume": "float64",
+    "close_time": "int64",
+    "quote_asset_volume": "float64",
+    "number_of_trades": "int64",
+    "taker_buy_base_asset_volume": "float64",
+    "taker_buy_quote_asset_volume": "float64",
+    "_unused": "float64",
+}
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Quantidade de tentativas para falhas transitórias do servidor de arquivos
+ARCHIVE_MAX_RETRIES = 3
+
+# Uploads simultâneos para o GCS dentro de cada mês
+UPLOAD_MAX_WORKERS = 8
+
+
+class ArchiveChecksumError(Exception):
+    # O arquivo baixado não confere com o checksum publicado pela Binance
+    pass
+
+
+def generate_archive_url(archive_base_url, symbol, interval, year, month):
+    # Gera a URL do arquivo zip mensal de klines no padrão do data.binance.vision
+    filename = f"{symbol}-{interval}-{year}-{month:02d}.zip"
+    return f"{archive_base_url}/{symbol}/{interval}/{filename}"
+
+
+def with_archive_retries(request_func, url, max_retries=ARCHIVE_MAX_RETRIES):
+    # Executa a requisição ao servidor de arquivos com retry para falhas transitórias
+    for attempt in range(max_retries):
+        try:
+            return request_func(url)
+        except requests.RequestException as e:
+            error = e
+
+        print(f"Tentativa {attempt + 1}: Erro ao acessar {url}: {error}")
+
+        # Não aguarda após a última tentativa
+        if attempt < max_retries - 1:
+            time.sleep(get_backoff_delay(attempt))
+
+    raise error
+
+
+def get_archive_checksum(checksum_url):
+    # Lê o arquivo .CHECKSUM; retorna None se não existir
+    with requests.get(checksum_url, timeout=60) as response:
+        if response.status_code == 404:
+            return None
+
+        response.raise_for_status()
+        return response.text.split()[0].lower()
+
+
+def stream_archive(archive_url):
+    # Baixa o arquivo zip em streaming, calculando o SHA-256 durante o download
+    with requests.get(archive_url, stream=True, timeout=60) as response:
+        if response.status_code == 404:
+            return None, None
+
+        response.raise_for_status()
+
+        sha256 = hashlib.sha256()
+        temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
+        try:
+            with temp_zip:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    temp_zip.write(chunk)
+        except BaseException:
+            os.remove(temp_zip.name)
+            raise
+
+    return temp_zip.name, sha256.hexdigest()
+
+
+def fetch_archive_checksum(archive_url):
+    # Obtém o SHA-256 publicado pela Binance para o arquivo zip
+    return with_archive_retries(get_archive_checksum, f"{archive_url}.CHECKSUM")
+
+
+def download_archive(archive_url):
+    # Baixa o arquivo zip, repetindo o download completo em caso de falha no meio
+    return with_archive_retries(stream_archive, archive_url)
+
+
+def read_klines_archive(zip_path):
+    # Lê o CSV do arquivo zip sem extraí-lo para o disco
+    with zipfile.ZipFile(zip_path) as archive:
+        csv_name = archive.namelist()[0]
+
+        # Alguns arquivos possuem cabeçalho; verifica a primeira linha antes da leitura
+        with archive.open(csv_name) as csv_file:
+            first_line = csv_file.readline()
+        header = None if first_line[:1].isdigit() else 0
+
+        with archive.open(csv_name) as csv_file:
+            df = pd.read_csv(
+                csv_file,
+                header=header,
+                names=ARCHIVE_COLUMNS,
+                dtype=ARCHIVE_DTYPES,
+            )
+
+    # Remove a coluna '_unused', que não é necessária
+    df.drop(columns=["_unused"], inplace=True)
+
+    # A partir de 2025 os arquivos de spot usam microssegundos; normaliza para milissegundos
+    for col in ["open_time", "close_time"]:
+        microseconds = df[col] >= 10**13
+        df.loc[microseconds, col] = df.loc[microseconds, col] // 1000
+
+    return df
+
+
+def fetch_monthly_klines(archive_base_url, symbol, interval, year, month):
+    # Baixa, valida e converte o arquivo mensal de klines em um DataFrame
+    archive_url = generate_archive_url(archive_base_url, symbol, interval, year, month)
+    expected_checksum = fetch_archive_checksum(archive_url)
+
+    if expected_checksum is None:
+        print(f"{symbol}: Arquivo mensal não encontrado: {archive_url}")
+        return None
+
+    # Downloads truncados ou corrompidos costumam ser transitórios; baixa novamente
+    for attempt in range(ARCHIVE_MAX_RETRIES):
+        zip_path, checksum = download_archive(archive_url)
+
+        if zip_path is None:
+            print(f"{symbol}: Arquivo mensal não encontrado: {archive_url}")
+            return None
+
+        try:
+            if checksum == expected_checksum:
+                df = read_klines_archive(zip_path)
+                break
+        finally:
+            os.remove(zip_path)
+
+        print(
+            f"Tentativa {attempt + 1}: Checksum inválido para {archive_url}: esperado {expected_checksum}, obtido {checksum}"
+        )
+    else:
+        raise ArchiveChecksumError(f"Checksum inválido para {archive_url}")
+
+    print(f"{symbol}: {len(df)} registros obtidos de {archive_url}")
+    return df
+
+
+def upload_dataframe_to_gcs(bucket, df, gcs_path):
+    # Serializa o DataFrame em Parquet na memória e envia para o GCS
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    bucket.blob(gcs_path).upload_from_string(
+        buffer.getvalue(), content_type="application/octet-stream"
+    )
+
+
+def save_klines_chunks(bucket, symbol, chunks):
+    # Envia os blocos de um mês em paralelo, com os mesmos nomes gerados pela extração via API
+    gcs_paths = [
+        generate_gcs_path(symbol, chunk["open_time"].iloc[0]) for chunk in chunks
+    ]
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(upload_dataframe_to_gcs, bucket, chunk, gcs_path)
+            for chunk, gcs_path in zip(chunks, gcs_paths)
+        ]
+        errors = [future.exception() for future in futures]
+
+    failed = [i for i, error in enumerate(errors) if error is not None]
+    if not failed:
+        for gcs_path in gcs_paths:
+            print(f"Arquivo salvo em {gcs_path}")
+        return
+
+    # O último arquivo no GCS indica até onde os dados existem; remove os blocos
+    # enviados após a primeira falha para não deixar lacunas antes dele
+    first_failed = failed[0]
+    for i in range(first_failed + 1, len(chunks)):
+        if errors[i] is None:
+            bucket.blob(gcs_paths[i]).delete()
+            print(f"Arquivo removido: {gcs_paths[i]}")
+
+    raise errors[first_failed]
+
+
+def backfill_klines_from_archives(
+    symbol, bucket_name, interval, limit, start_time, archive_base_url
+):
+    # Carrega o histórico dos meses já fechados a partir dos arquivos mensais da Binance
+    now = datetime.datetime.now(datetime.timezone.utc)
+    start_dt = datetime.datetime.utcfromtimestamp(start_time / 1000)
+    year, month = start_dt.year, start_dt.month
+
+    next_start_time = start_time
+    pending = None
+
+    # Um único cliente do GCS é reutilizado em todos os uploads do backfill
+    bucket = storage.Client().bucket(bucket_name)
+
+    # O mês corrente ainda está aberto e continua sendo extraído pela API
+    while (year, month) < (now.year, now.month):
+        try:
+            df = fetch_monthly_klines(archive_base_url, symbol, interval, year, month)
+        except (requests.RequestException, ArchiveChecksumError) as e:
+            # Arquivo indisponível ou corrompido: a extração via API continua daqui
+            print(f"{symbol}: Falha ao obter arquivo mensal ({e}). Seguindo via API.")
+            break
+
+        # Lacunas após o início dos dados são deixadas para a extração via API
+        if df is None and pending is not None:
+            break
+
+        if df is not None:
+            df = df[df["open_time"] >= start_time]
+            if pending is not None:
+                df = pd.concat([pending, df], ignore_index=True)
+
+            # Divide os dados em blocos de 'limit' registros, como na paginação da API
+            full_rows = len(df) // limit * limit
+            chunks = [
+                df.iloc[i : i + limit].reset_index(drop=True)
+                for i in range(0, full_rows, limit)
+            ]
+
+            if chunks:
+                save_klines_chunks(bucket, symbol, chunks)
+                next_start_time = int(chunks[-1]["close_time"].max()) + 1
+
+            # Registros restantes são completados no mês seguinte
+            pending = df.iloc[full_rows:].reset_index(drop=True)
+
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+    # A extração via API retoma a partir do primeiro registro ainda não salvo
+    if pending is not None and not pending.empty:
+        next_start_time = int(pending["open_time"].iloc[0])
+
+    print(
+        f"{symbol}: Backfill concluído. Extração via API a partir de {next_start_time} ({datetime.datetime.utcfromtimestamp(next_start_time / 1000)})"
+    )
+    return next_start_time
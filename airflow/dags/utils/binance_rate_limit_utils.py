@@ -0,0 +1,145 @@
+import fcntl
+import json
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from airflow.exceptions import AirflowFailException
+
+# Limite padrão de peso por minuto da API da Binance (X-MBX-USED-WEIGHT-1M)
+DEFAULT_WEIGHT_LIMIT = 6000
+
+# Fração do limite a partir da qual as requisições são seguradas preventivamente
+DEFAULT_SAFETY_MARGIN = 0.9
+
+# Arquivo compartilhado entre as tasks do mesmo host com o estado do orçamento
+DEFAULT_STATE_FILE = os.path.join(tempfile.gettempdir(), "binance_rate_limit.json")
+
+# Bloqueios mais longos que este valor (em segundos) falham a task em vez de aguardar
+DEFAULT_MAX_RETRY_AFTER = 300
+
+# Parâmetros do backoff exponencial com jitter
+BASE_BACKOFF_SECONDS = 10
+MAX_BACKOFF_SECONDS = 120
+
+
+@contextmanager
+def locked_state(state_file):
+    # Abre o arquivo de estado com lock exclusivo e persiste as alterações ao sair
+    fd = os.open(state_file, os.O_RDWR | os.O_CREAT, 0o666)
+    with os.fdopen(fd, "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            content = f.read()
+            try:
+                state = json.loads(content) if content else {}
+            except ValueError:
+                state = {}
+
+            state.setdefault("window_start", 0)
+            state.setdefault("used_weight", 0)
+            state.setdefault("banned_until", 0)
+
+            yield state
+
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current_window_start(now):
+    # A Binance contabiliza o peso em janelas de um minuto
+    return int(now // 60) * 60
+
+
+def reserve_request_weight(
+    weight,
+    weight_limit=DEFAULT_WEIGHT_LIMIT,
+    safety_margin=DEFAULT_SAFETY_MARGIN,
+    state_file=DEFAULT_STATE_FILE,
+    max_retry_after=DEFAULT_MAX_RETRY_AFTER,
+):
+    # Reserva o peso da requisição no orçamento compartilhado, aguardando se necessário
+    budget = int(weight_limit * safety_margin)
+
+    while True:
+        now = time.time()
+        window_start = current_window_start(now)
+
+        with locked_state(state_file) as state:
+            if state["window_start"] != window_start:
+                state["window_start"] = window_start
+                state["used_weight"] = 0
+
+            if now < state["banned_until"]:
+                wait = state["banned_until"] - now
+                check_retry_after(wait, max_retry_after)
+            elif state["used_weight"] + weight > budget:
+                wait = window_start + 60 - now
+            else:
+                state["used_weight"] += weight
+                return
+
+        # Aguarda fora do lock para não bloquear as demais tasks
+        wait += random.uniform(0, 1)
+        print(f"Aguardando liberação do limite de peso da Binance ({wait:.1f}s)...")
+        time.sleep(wait)
+
+
+def register_response(response, state_file=DEFAULT_STATE_FILE):
+    # Sincroniza o orçamento com o peso informado pela Binance e registra bloqueios
+    now = time.time()
+    window_start = current_window_start(now)
+    used_weight = response.headers.get("X-MBX-USED-WEIGHT-1M")
+    retry_after = get_retry_after(response)
+
+    with locked_state(state_file) as state:
+        if state["window_start"] != window_start:
+            state["window_start"] = window_start
+            state["used_weight"] = 0
+
+        # O header reflete o peso consumido por todo o IP, inclusive outras tasks
+        if used_weight is not None and used_weight.isdigit():
+            state["used_weight"] = max(state["used_weight"], int(used_weight))
+
+        # Sem Retry-After, bloqueia as demais tasks ao menos até o fim da janela atual
+        if response.status_code in (418, 429):
+            if retry_after is None:
+                banned_until = window_start + 60
+            else:
+                banned_until = now + retry_after
+            state["banned_until"] = max(state["banned_until"], banned_until)
+
+
+def get_retry_after(response):
+    # Extrai o header Retry-After (em segundos), se presente
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        return None
+
+
+def check_retry_after(retry_after, max_retry_after=DEFAULT_MAX_RETRY_AFTER):
+    # Falha imediatamente quando o bloqueio da Binance é longo demais para aguardar
+    if retry_after is not None and retry_after > max_retry_after:
+        raise AirflowFailException(
+            f"Binance bloqueou as requisições por {retry_after:.0f}s (máximo de {max_retry_after}s)."
+        )
+
+
+def get_backoff_delay(attempt, retry_after=None):
+    # Calcula o tempo de espera com backoff exponencial e jitter, respeitando o Retry-After
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2**attempt)
+    delay = random.uniform(delay / 2, delay)
+
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+
+    return delay
@@ -7,6 +7,17 @@ import tempfile
 import os
 import datetime
 import calendar
+from utils.binance_rate_limit_utils import (
+    DEFAULT_WEIGHT_LIMIT,
+    DEFAULT_SAFETY_MARGIN,
+    DEFAULT_STATE_FILE,
+    DEFAULT_MAX_RETRY_AFTER,
+    reserve_request_weight,
+    register_response,
+    get_retry_after,
+    check_retry_after,
+    get_backoff_delay,
+)
 
 
 def delete_parquet_from_gcs(bucket_name, gcs_path):
@@ -112,18 +123,36 @@ def generate_gcs_path(symbol, start_time):
     return gcs_path
 
 
-def fetch_data(url, max_retries=3):
-    # Faz uma requisição à API da Binance com tentativas de retry
-    retry_delay = 10
+def fetch_data(url, max_retries=3, request_weight=2, rate_limit=None):
+    # Faz uma requisição à API da Binance respeitando o limite de peso compartilhado
+    rate_limit = rate_limit or {}
+    weight_limit = rate_limit.get("weight_limit", DEFAULT_WEIGHT_LIMIT)
+    safety_margin = rate_limit.get("safety_margin", DEFAULT_SAFETY_MARGIN)
+    state_file = rate_limit.get("state_file", DEFAULT_STATE_FILE)
+    max_retry_after = rate_limit.get("max_retry_after", DEFAULT_MAX_RETRY_AFTER)
 
     for attempt in range(max_retries):
+        reserve_request_weight(
+            request_weight, weight_limit, safety_margin, state_file, max_retry_after
+        )
+
         response = requests.get(url)
+        register_response(response, state_file)
 
         if response.status_code == 200:
             return response.json()
 
         print(f"Tentativa {attempt + 1}: Erro {response.status_code} - {response.text}")
-        time.sleep(retry_delay)
+
+        # 429 indica limite excedido e 418 bloqueio do IP; ambos informam o Retry-After
+        retry_after = None
+        if response.status_code in (418, 429):
+            retry_after = get_retry_after(response)
+            check_retry_after(retry_after, max_retry_after)
+
+        # Não aguarda após a última tentativa, já que a task falhará de qualquer forma
+        if attempt < max_retries - 1:
+            time.sleep(get_backoff_delay(attempt, retry_after))
 
     raise AirflowFailException(
         "Erro ao obter dados da Binance após múltiplas tentativas."
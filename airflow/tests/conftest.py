@@ -0,0 +1,5 @@
+import os
+import sys
+
+# As DAGs importam os módulos a partir de 'dags/', como no container do Airflow
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../dags")))
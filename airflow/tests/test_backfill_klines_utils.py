@@ -0,0 +1,293 @@
+import calendar
+import collections
+import datetime
+import functools
+import hashlib
+import io
+import threading
+import types
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import utils.backfill_klines_utils as backfill_klines_utils
+from utils.backfill_klines_utils import (
+    backfill_klines_from_archives,
+    read_klines_archive,
+    save_klines_chunks,
+)
+from utils.fetch_klines_utils import generate_gcs_path
+
+SYMBOL = "BTCBRL"
+INTERVAL = "1m"
+LIMIT = 1000
+
+
+class ArchiveRequestHandler(SimpleHTTPRequestHandler):
+    # Servidor de arquivos local no layout do data.binance.vision
+    failing_paths = set()
+    truncated_paths = collections.Counter()
+    request_counts = collections.Counter()
+
+    def do_GET(self):
+        self.request_counts[self.path] += 1
+
+        if self.path in self.failing_paths:
+            self.send_error(500)
+            return
+
+        # Envia só metade do arquivo, simulando uma conexão interrompida no meio
+        if self.truncated_paths[self.path] > 0:
+            self.truncated_paths[self.path] -= 1
+            with open(self.translate_path(self.path), "rb") as f:
+                content = f.read()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content[: len(content) // 2])
+            self.close_connection = True
+            return
+
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_string(self, data, content_type=None):
+        if self.name in self.bucket.failing_paths:
+            raise RuntimeError(f"Falha no upload de {self.name}")
+        self.bucket.files[self.name] = data
+
+    def delete(self):
+        del self.bucket.files[self.name]
+
+
+class FakeBucket:
+    # Bucket do GCS em memória
+    def __init__(self):
+        self.files = {}
+        self.failing_paths = set()
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+@pytest.fixture
+def archive_server(tmp_path):
+    ArchiveRequestHandler.failing_paths = set()
+    ArchiveRequestHandler.truncated_paths = collections.Counter()
+    ArchiveRequestHandler.request_counts = collections.Counter()
+    handler = functools.partial(ArchiveRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield tmp_path, f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def gcs_bucket(monkeypatch):
+    # Substitui o cliente do GCS por um bucket em memória e elimina as esperas do retry
+    bucket = FakeBucket()
+    client = types.SimpleNamespace(bucket=lambda bucket_name: bucket)
+    monkeypatch.setattr(
+        backfill_klines_utils, "storage", types.SimpleNamespace(Client=lambda: client)
+    )
+    monkeypatch.setattr(
+        backfill_klines_utils, "time", types.SimpleNamespace(sleep=lambda seconds: None)
+    )
+    return bucket
+
+
+def read_saved_chunks(bucket):
+    # Lê os Parquets enviados ao bucket, na ordem dos nomes (e portanto do tempo)
+    return [
+        pd.read_parquet(io.BytesIO(bucket.files[name])) for name in sorted(bucket.files)
+    ]
+
+
+def past_month(months_ago):
+    # Retorna (ano, mês) de um mês já fechado em relação ao mês corrente
+    now = datetime.datetime.now(datetime.timezone.utc)
+    index = now.year * 12 + now.month - 1 - months_ago
+    return index // 12, index % 12 + 1
+
+
+def month_start_ms(year, month):
+    return calendar.timegm((year, month, 1, 0, 0, 0)) * 1000
+
+
+def write_archive(
+    directory, year, month, rows, microseconds=False, checksum=None, header=False
+):
+    # Gera o zip mensal e o respectivo .CHECKSUM com 'rows' klines de 1 minuto
+    start = month_start_ms(year, month)
+    multiplier = 1000 if microseconds else 1
+    lines = []
+    if header:
+        lines.append("open_time,open,high,low,close,volume,close_time,quote_volume,count,taker_buy_volume,taker_buy_quote_volume,ignore")
+    for i in range(rows):
+        open_time = start + i * 60000
+        close_time = open_time + 59999
+        lines.append(
+            f"{open_time * multiplier},1.5,2.0,1.0,1.75,10.0,{close_time * multiplier},17.5,{i},4.0,7.0,0"
+        )
+
+    name = f"{SYMBOL}-{INTERVAL}-{year}-{month:02d}"
+    archive_dir = directory / SYMBOL / INTERVAL
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    zip_path = archive_dir / f"{name}.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(f"{name}.csv", "\n".join(lines) + "\n")
+
+    checksum = checksum or hashlib.sha256(zip_path.read_bytes()).hexdigest()
+    (archive_dir / f"{name}.zip.CHECKSUM").write_text(f"{checksum}  {name}.zip\n")
+    return zip_path, f"/{SYMBOL}/{INTERVAL}/{name}.zip"
+
+
+def test_read_klines_archive_converts_microseconds(tmp_path):
+    year, month = past_month(2)
+    zip_path, _ = write_archive(tmp_path, year, month, 3, microseconds=True)
+
+    df = read_klines_archive(zip_path)
+
+    start = month_start_ms(year, month)
+    assert list(df["open_time"]) == [start, start + 60000, start + 120000]
+    assert df["close_time"].iloc[0] == start + 59999
+    assert "_unused" not in df.columns
+    assert str(df["open_time"].dtype) == "int64"
+    assert str(df["open_price"].dtype) == "float64"
+
+
+def test_read_klines_archive_skips_header(tmp_path):
+    year, month = past_month(2)
+    zip_path, _ = write_archive(tmp_path, year, month, 2, header=True)
+
+    df = read_klines_archive(zip_path)
+
+    assert list(df["open_time"]) == [
+        month_start_ms(year, month),
+        month_start_ms(year, month) + 60000,
+    ]
+
+
+def test_backfill_carries_pending_rows_into_next_month(archive_server, gcs_bucket):
+    directory, base_url = archive_server
+    first, second = past_month(4), past_month(3)
+    write_archive(directory, *first, 2500)
+    write_archive(directory, *second, 1700, microseconds=True)
+
+    next_start_time = backfill_klines_from_archives(
+        SYMBOL, "bucket", INTERVAL, LIMIT, month_start_ms(*first), base_url
+    )
+
+    saved_chunks = read_saved_chunks(gcs_bucket)
+    assert [len(chunk) for chunk in saved_chunks] == [LIMIT] * 4
+
+    # Os arquivos seguem os nomes gerados pela extração via API
+    assert sorted(gcs_bucket.files) == [
+        generate_gcs_path(SYMBOL, chunk["open_time"].iloc[0]) for chunk in saved_chunks
+    ]
+
+    # O terceiro bloco começa no primeiro mês e termina no segundo
+    boundary_chunk = saved_chunks[2]
+    assert boundary_chunk["open_time"].iloc[0] == month_start_ms(*first) + 2000 * 60000
+    assert boundary_chunk["open_time"].iloc[500] == month_start_ms(*second)
+    assert boundary_chunk["open_time"].is_monotonic_increasing
+
+    # O mês seguinte não existe: a API retoma a partir dos 200 registros restantes
+    assert next_start_time == month_start_ms(*second) + 1500 * 60000
+
+
+def test_backfill_resumes_after_missing_month(archive_server, gcs_bucket):
+    directory, base_url = archive_server
+    first, after_gap = past_month(4), past_month(2)
+    write_archive(directory, *first, 2000)
+    write_archive(directory, *after_gap, 1000)
+
+    next_start_time = backfill_klines_from_archives(
+        SYMBOL, "bucket", INTERVAL, LIMIT, month_start_ms(*first), base_url
+    )
+
+    # O mês após a lacuna fica para a API, que retoma após o último bloco salvo
+    saved_chunks = read_saved_chunks(gcs_bucket)
+    assert len(saved_chunks) == 2
+    assert next_start_time == saved_chunks[-1]["close_time"].iloc[-1] + 1
+    assert next_start_time == month_start_ms(*first) + 2000 * 60000
+
+
+def test_backfill_falls_back_to_api_on_server_errors(archive_server, gcs_bucket):
+    directory, base_url = archive_server
+    first, second = past_month(4), past_month(3)
+    write_archive(directory, *first, 1500)
+    _, failing_path = write_archive(directory, *second, 1000)
+    ArchiveRequestHandler.failing_paths = {failing_path}
+
+    next_start_time = backfill_klines_from_archives(
+        SYMBOL, "bucket", INTERVAL, LIMIT, month_start_ms(*first), base_url
+    )
+
+    assert ArchiveRequestHandler.request_counts[failing_path] == 3
+    assert len(gcs_bucket.files) == 1
+    assert next_start_time == month_start_ms(*first) + 1000 * 60000
+
+
+def test_backfill_retries_interrupted_download(archive_server, gcs_bucket):
+    directory, base_url = archive_server
+    first = past_month(4)
+    _, archive_path = write_archive(directory, *first, 1000)
+    ArchiveRequestHandler.truncated_paths[archive_path] = 1
+
+    next_start_time = backfill_klines_from_archives(
+        SYMBOL, "bucket", INTERVAL, LIMIT, month_start_ms(*first), base_url
+    )
+
+    assert ArchiveRequestHandler.request_counts[archive_path] == 2
+    assert len(gcs_bucket.files) == 1
+    assert next_start_time == month_start_ms(*first) + 1000 * 60000
+
+
+def test_backfill_falls_back_to_api_on_checksum_mismatch(archive_server, gcs_bucket):
+    directory, base_url = archive_server
+    first, second = past_month(4), past_month(3)
+    write_archive(directory, *first, 1500)
+    _, corrupted_path = write_archive(directory, *second, 1000, checksum="0" * 64)
+
+    next_start_time = backfill_klines_from_archives(
+        SYMBOL, "bucket", INTERVAL, LIMIT, month_start_ms(*first), base_url
+    )
+
+    # O arquivo é baixado novamente antes de desistir e seguir via API
+    assert ArchiveRequestHandler.request_counts[corrupted_path] == 3
+    assert len(gcs_bucket.files) == 1
+    assert next_start_time == month_start_ms(*first) + 1000 * 60000
+
+
+def test_save_klines_chunks_removes_newer_chunks_on_failure(tmp_path, gcs_bucket):
+    year, month = past_month(4)
+    zip_path, _ = write_archive(tmp_path, year, month, 5 * LIMIT)
+    df = read_klines_archive(zip_path)
+    chunks = [
+        df.iloc[i : i + LIMIT].reset_index(drop=True) for i in range(0, len(df), LIMIT)
+    ]
+    gcs_paths = [
+        generate_gcs_path(SYMBOL, chunk["open_time"].iloc[0]) for chunk in chunks
+    ]
+    gcs_bucket.failing_paths = {gcs_paths[2]}
+
+    with pytest.raises(RuntimeError):
+        save_klines_chunks(gcs_bucket, SYMBOL, chunks)
+
+    # Apenas os blocos anteriores à falha permanecem, sem lacunas antes do mais recente
+    assert sorted(gcs_bucket.files) == gcs_paths[:2]
@@ -0,0 +1,176 @@
+import json
+
+import pytest
+from airflow.exceptions import AirflowFailException
+
+import utils.binance_rate_limit_utils as binance_rate_limit_utils
+import utils.fetch_klines_utils as fetch_klines_utils
+from utils.binance_rate_limit_utils import register_response, reserve_request_weight
+from utils.fetch_klines_utils import fetch_data
+
+# Início de uma janela de um minuto qualquer, em segundos
+WINDOW_START = 1_700_000_040
+
+
+class FakeClock:
+    # Relógio controlado pelos testes; sleep avança o tempo em vez de bloquear
+    def __init__(self, now):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, payload=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(WINDOW_START + 10)
+    monkeypatch.setattr(binance_rate_limit_utils, "time", clock)
+    monkeypatch.setattr(fetch_klines_utils, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def state_file(tmp_path):
+    return str(tmp_path / "binance_rate_limit.json")
+
+
+def write_state(state_file, window_start, used_weight=0, banned_until=0):
+    with open(state_file, "w") as f:
+        json.dump(
+            {
+                "window_start": window_start,
+                "used_weight": used_weight,
+                "banned_until": banned_until,
+            },
+            f,
+        )
+
+
+def read_state(state_file):
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def test_reserve_resets_used_weight_on_new_window(clock, state_file):
+    write_state(state_file, WINDOW_START - 60, used_weight=5000)
+
+    reserve_request_weight(2, state_file=state_file)
+
+    assert read_state(state_file)["window_start"] == WINDOW_START
+    assert read_state(state_file)["used_weight"] == 2
+    assert clock.sleeps == []
+
+
+def test_reserve_waits_for_next_window_near_budget(clock, state_file):
+    # Orçamento de 5400 (6000 * 0.9); a próxima requisição o ultrapassaria
+    write_state(state_file, WINDOW_START, used_weight=5399)
+
+    reserve_request_weight(2, weight_limit=6000, safety_margin=0.9, state_file=state_file)
+
+    assert len(clock.sleeps) == 1
+    assert 50 <= clock.sleeps[0] <= 51
+    assert read_state(state_file)["window_start"] == WINDOW_START + 60
+    assert read_state(state_file)["used_weight"] == 2
+
+
+def test_register_response_only_raises_used_weight(clock, state_file):
+    write_state(state_file, WINDOW_START, used_weight=300)
+
+    register_response(FakeResponse(200, {"X-MBX-USED-WEIGHT-1M": "100"}), state_file)
+    assert read_state(state_file)["used_weight"] == 300
+
+    register_response(FakeResponse(200, {"X-MBX-USED-WEIGHT-1M": "500"}), state_file)
+    assert read_state(state_file)["used_weight"] == 500
+
+
+@pytest.mark.parametrize("status_code", [418, 429])
+def test_register_response_bans_until_window_end_without_retry_after(
+    clock, state_file, status_code
+):
+    register_response(FakeResponse(status_code), state_file)
+
+    assert read_state(state_file)["banned_until"] == WINDOW_START + 60
+
+
+def test_register_response_uses_retry_after(clock, state_file):
+    register_response(FakeResponse(429, {"Retry-After": "120"}), state_file)
+
+    assert read_state(state_file)["banned_until"] == clock.now + 120
+
+
+def test_reserve_fails_on_ban_longer_than_max_retry_after(clock, state_file):
+    write_state(state_file, WINDOW_START, banned_until=clock.now + 3600)
+
+    with pytest.raises(AirflowFailException):
+        reserve_request_weight(2, state_file=state_file, max_retry_after=300)
+
+    assert clock.sleeps == []
+
+
+def test_reserve_waits_for_short_ban(clock, state_file):
+    write_state(state_file, WINDOW_START, banned_until=clock.now + 30)
+
+    reserve_request_weight(2, state_file=state_file)
+
+    assert len(clock.sleeps) == 1
+    assert 30 <= clock.sleeps[0] <= 31
+
+
+def test_fetch_data_does_not_sleep_after_last_attempt(clock, state_file, monkeypatch):
+    calls = []
+
+    def fake_get(url):
+        calls.append(url)
+        return FakeResponse(500, payload={"msg": "erro"})
+
+    monkeypatch.setattr(fetch_klines_utils.requests, "get", fake_get)
+
+    with pytest.raises(AirflowFailException):
+        fetch_data("http://binance", max_retries=3, rate_limit={"state_file": state_file})
+
+    assert len(calls) == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_fetch_data_respects_retry_after(clock, state_file, monkeypatch):
+    responses = [
+        FakeResponse(429, {"Retry-After": "40"}),
+        FakeResponse(200, payload=[[1, "1.0"]]),
+    ]
+    monkeypatch.setattr(
+        fetch_klines_utils.requests, "get", lambda url: responses.pop(0)
+    )
+
+    data = fetch_data("http://binance", rate_limit={"state_file": state_file})
+
+    assert data == [[1, "1.0"]]
+    assert sum(clock.sleeps) >= 40
+
+
+def test_fetch_data_fails_on_long_retry_after(clock, state_file, monkeypatch):
+    monkeypatch.setattr(
+        fetch_klines_utils.requests,
+        "get",
+        lambda url: FakeResponse(418, {"Retry-After": "86400"}),
+    )
+
+    with pytest.raises(AirflowFailException):
+        fetch_data("http://binance", rate_limit={"state_file": state_file})
+
+    assert clock.sleeps == []